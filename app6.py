@@ -3,7 +3,7 @@
 # - Landing page: pick a function (ER&D, Supply Chain, Procurement, Manufacturing)
 # - ER&D uses approved wording (exact body text preserved)
 # - Non-ER&D functions use identical UI/logic with placeholder "lorem ipsum" bodies
-# - Includes hardening: Jinja auto-escape, Excel dtype=str, single Outlook COM session reuse,
+# - Includes hardening: HTML auto-escape, Excel dtype=str, single Outlook COM session reuse,
 #   recipient normalization & dedup, validation, per-row status.
 
 from __future__ import annotations
@@ -11,14 +11,19 @@ import io
 import os
 import re
 import sys
+import shutil
 import zipfile
 import tempfile
-from datetime import datetime
-from typing import List, Dict
+import functools
+import queue
+import threading
+from datetime import date, datetime
+from typing import Callable, List, Dict, Optional, Tuple
 
 import pandas as pd
 import streamlit as st
-from jinja2 import Environment, select_autoescape
+from markupsafe import escape
+from openpyxl import load_workbook
 
 # -------------------------------------
 # Environment: require Windows + Outlook (pywin32)
@@ -31,49 +36,74 @@ try:
 except Exception:
     HAS_WIN32 = False
 
+# Optional: python-calamine (Rust) parses .xlsx much faster than openpyxl
+try:
+    from python_calamine import CalamineWorkbook  # type: ignore
+    HAS_CALAMINE = True
+except Exception:
+    HAS_CALAMINE = False
+
 # -------------------------------------
-# Jinja (safe HTML auto-escape)
+# Templates (safe HTML auto-escape)
 # -------------------------------------
-_JINJA_ENV = Environment(
-    autoescape=select_autoescape(enabled_extensions=(), default=True)
-)
-
-def render_text(template_str: str, context: dict) -> str:
-    tmpl = _JINJA_ENV.from_string(template_str)
-    return tmpl.render(**context)
+# Templates only use `{{ var }}` substitutions. Each is compiled once into a renderer over a
+# context escaped once per row (see escape_context).
+_VAR_RE = re.compile(r"\{\{\s*([A-Za-z_]\w*)\s*\}\}")
+
+TemplateRenderer = Callable[[Dict[str, str]], str]
+
+class _EscapedContext(dict):
+    def __missing__(self, key):
+        return ""  # unknown names render empty (Jinja's default Undefined behaviour)
+
+def escape_context(ctx: dict) -> Dict[str, str]:
+    """HTML-escape every context value once; shared by the subject and all bodies of a row."""
+    return _EscapedContext({k: str(escape(v)) for k, v in ctx.items()})
+
+@functools.lru_cache(maxsize=None)
+def compile_template(template_str: str) -> TemplateRenderer:
+    """Specialize a `{{ var }}` template once; the subjects/bodies are constants.
+       The template is pre-split into [literal, name, literal, ...] so a render is one
+       slice-assign + join, with no template/format-string parsing per call."""
+    pieces = _VAR_RE.split(template_str)
+    for literal in pieces[::2]:
+        if "{{" in literal or "{%" in literal or "{#" in literal:
+            raise ValueError(f"Unsupported template syntax (only {{{{ var }}}} is allowed): {literal.strip()[:60]!r}")
+    names = pieces[1::2]
+
+    def render(ectx: Dict[str, str]) -> str:
+        out = pieces.copy()
+        out[1::2] = [ectx[n] for n in names]
+        return "".join(out)
+    return render
 
 # -------------------------------------
 # Helpers
 # -------------------------------------
+_SANITIZE_TABLE = str.maketrans({c: "-" for c in '<>:"/\\|?*\n\r\t'})
+
 def sanitize_filename(name: str) -> str:
-    bad = '<>:"/\\|?*\n\r\t'
-    for ch in bad:
-        name = name.replace(ch, "-")
-    return " ".join(name.split()).strip()
-
-def _split_recipients(s: str) -> List[str]:
-    s = str(s or "").replace(",", ";")  # allow comma-separated inputs from Excel
-    return [p.strip() for p in s.split(";") if p.strip()]
-
-def build_cc(*chunks: str) -> str:
-    """Normalize + merge semicolon lists, de-dup (case-insensitive), keep order."""
-    parts = []
-    for s in chunks:
-        parts.extend(_split_recipients(s))
-    seen = set()
-    out = []
-    for p in parts:
-        key = p.lower()
-        if key in seen:
-            continue
-        seen.add(key)
-        out.append(p)
-    return "; ".join(out)
-
-def dedup_against_to(to_: str, cc_: str) -> str:
-    to_set = {x.lower() for x in _split_recipients(to_)}
-    cc_list = [x for x in _split_recipients(cc_) if x.lower() not in to_set]
-    return "; ".join(cc_list)
+    return " ".join(name.translate(_SANITIZE_TABLE).split())
+
+_RECIPIENT_SEP_RE = re.compile(r"[;,]")  # Excel inputs use either separator
+
+def _recipient_parts(col: pd.Series) -> pd.Series:
+    """Split a column of recipient lists (comma or semicolon separated) into one stripped,
+       non-empty entry per element; the index repeats the source row label."""
+    parts = col.str.split(_RECIPIENT_SEP_RE).explode().str.strip()
+    return parts[parts.fillna("").ne("")]
+
+def build_cc_column(to_col: pd.Series, *chunks) -> pd.Series:
+    """Column-wise CC builder. Chunks are columns or constant addresses.
+       Merges them in order, de-dups case-insensitively (first wins) and drops anything already in To."""
+    cols = [c if isinstance(c, pd.Series) else pd.Series(c, index=to_col.index) for c in chunks]
+    joined = cols[0].str.cat(cols[1:], sep=";") if len(cols) > 1 else cols[0]
+    parts = _recipient_parts(joined)
+    keys = pd.MultiIndex.from_arrays([parts.index, parts.str.lower()])
+    to_parts = _recipient_parts(to_col)
+    to_keys = pd.MultiIndex.from_arrays([to_parts.index, to_parts.str.lower()])
+    keep = ~keys.duplicated() & ~keys.isin(to_keys)
+    return parts[keep].groupby(level=0).agg("; ".join).reindex(to_col.index, fill_value="")
 
 def strip_angle_display(s: str) -> str:
     """
@@ -92,62 +122,190 @@ def derive_display_name_from_email(email: str) -> str:
     pretty = local.replace(".", " ").replace("_", " ").replace("-", " ").strip()
     return " ".join(w.capitalize() for w in pretty.split()) or "POC"
 
-EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
-
-def looks_like_email(s: str) -> bool:
-    s = strip_angle_display(s)
-    return bool(EMAIL_RE.match(s))
-
-def assert_recipients_or_warn(row_idx: int, label: str, recips: str) -> bool:
-    bad = []
-    for r in _split_recipients(recips):
-        if r == "//":
-            continue  # allowed literal marker
-        core = strip_angle_display(r)
-        # Permit "Display Name <email@...>" OR plain email
-        if "<" in r and ">" in r:
-            if not looks_like_email(core):
-                bad.append(r)
-        else:
-            if not looks_like_email(core):
-                bad.append(r)
+# Used with fullmatch: anchored at both ends, no trailing-newline leniency of `$`
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+def invalid_recipients_column(col: pd.Series) -> pd.Series:
+    """Column-wise recipient validation. Permits plain emails, "Display Name <email@...>"
+       and the literal '//' marker; returns the offending entries per row ("" when all valid)."""
+    parts = _recipient_parts(col)
+    inside = parts.str.extract(r"<([^>]*)", expand=False).str.strip()
+    angled = parts.str.contains("<", regex=False) & parts.str.contains(">", regex=False)
+    core = inside.where(angled & inside.fillna("").ne(""), parts)  # same rule as strip_angle_display
+    ok = parts.eq("//") | core.str.fullmatch(EMAIL_RE).fillna(False)
+    return parts[~ok].groupby(level=0).agg(", ".join).reindex(col.index, fill_value="")
+
+def check_recipients(row_idx: int, label: str, bad: str) -> Tuple[bool, Optional[str]]:
+    """`bad` is the row's entry from invalid_recipients_column. Returns (ok, warning message);
+       callers collect the messages and show them once instead of one st.warning per row."""
     if bad:
-        st.warning(f"Row {row_idx+1}: Invalid {label} -> {', '.join(bad)}")
-        return False
-    return True
+        return False, f"Row {row_idx+1}: Invalid {label} -> {bad}"
+    return True, None
+
+def _cell_str(v) -> str:
+    """Excel cell -> text the way read_excel(dtype=str) shows it (empty for blanks, 7.0 -> "7")."""
+    if v is None:
+        return ""
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    if isinstance(v, date) and not isinstance(v, datetime):  # calamine yields dates for midnight datetimes
+        v = datetime(v.year, v.month, v.day)
+    return str(v)
+
+def _trim_sheet(values: list) -> list:
+    """Drop trailing empty cells from every row and trailing empty rows, as read_excel does.
+       openpyxl's read-only rows run to the sheet dimension, which formatting alone extends."""
+    rows, last = [], -1
+    for n, r in enumerate(values):
+        r = list(r)
+        while r and (r[-1] is None or r[-1] == ""):
+            r.pop()
+        if r:
+            last = n
+        rows.append(r)
+    return rows[:last + 1]
+
+def _header_names(header: list, width: int) -> List[str]:
+    """Column names the way read_excel builds them: blanks become "Unnamed: i", and repeats are
+       numbered a.1, a.2, … (skipping names already in the header), named columns first."""
+    names = [_cell_str(h) for h in list(header) + [None] * (width - len(header))]
+    unnamed = [i for i, h in enumerate(names) if not h]
+    for i in unnamed:
+        names[i] = f"Unnamed: {i}"
+    counts: Dict[str, int] = {}
+    for i in [i for i in range(width) if i not in unnamed] + unnamed:
+        col = old = names[i]
+        cur = counts.get(col, 0)
+        if cur > 0:
+            while cur > 0:
+                counts[old] = cur + 1
+                col = f"{old}.{cur}"
+                cur = cur + 1 if col in names else counts.get(col, 0)
+            names[i] = col
+        counts[col] = cur + 1
+    return names
+
+@st.cache_data(show_spinner=False)
+def _load_excel(file_bytes: bytes) -> pd.DataFrame:
+    """Parse the first sheet once per distinct upload (cached across reruns) into an all-text frame.
+       Cells are read straight from python-calamine, or openpyxl in read-only (streaming) mode,
+       skipping read_excel's per-column parsing and type inference."""
+    # Both readers start at A1 like read_excel does, even when the first rows/columns are empty
+    if HAS_CALAMINE:
+        sheet = CalamineWorkbook.from_filelike(io.BytesIO(file_bytes)).get_sheet_by_index(0)
+        values = sheet.to_python(skip_empty_area=False)
+    else:
+        wb = load_workbook(io.BytesIO(file_bytes), read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[0]
+            ws.reset_dimensions()  # the stored dimension can be stale or start past A1
+            values = list(ws.iter_rows(values_only=True))
+        finally:
+            wb.close()
+    values = _trim_sheet(values)
+    if not values:
+        return pd.DataFrame()
+    header, body = values[0], values[1:]
+    width = max(len(r) for r in values)
+    columns = _header_names(header, width)
+    records = [[_cell_str(v) for v in r] + [""] * (width - len(r)) for r in body]
+    return pd.DataFrame(records, columns=columns, dtype=str)
 
 # -------------------------------------
 # Outlook session (reused for performance)
 # -------------------------------------
 class OutlookSession:
+    """One COM apartment + Outlook.Application + a single scratch MailItem and
+       scratch directory for the whole batch."""
     def __enter__(self):
         pythoncom.CoInitialize()
-        self.app = win32com.client.Dispatch("Outlook.Application")
-        return self.app
+        try:
+            try:
+                # Early-bound dispatch caches the typelib, avoiding IDispatch name lookups per property set
+                self.app = win32com.client.gencache.EnsureDispatch("Outlook.Application")
+            except Exception:
+                self.app = win32com.client.Dispatch("Outlook.Application")
+            self.mail = self.app.CreateItem(0)  # 0 = olMailItem; every field is overwritten per template
+        except Exception:
+            # __exit__ won't run when __enter__ raises, so release the apartment here
+            self.mail = self.app = None
+            pythoncom.CoUninitialize()
+            raise
+        self.tmpdir = tempfile.mkdtemp(prefix="oft_")
+        return self
     def __exit__(self, exc_type, exc, tb):
+        try:
+            self.mail.Close(1)  # 1 = olDiscard
+        except Exception:
+            pass
+        self.mail = self.app = None
         try:
             pythoncom.CoUninitialize()
         except Exception:
             pass
-
-def create_oft_bytes_reuse(outlook, subject: str, to_: str, cc_: str, bcc_: str, html_body: str) -> bytes:
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+class OutlookKeepAlive:
+    """Holds an Outlook.Application reference on a dedicated COM thread so Outlook stays
+       running between Generate clicks. The proxy is never handed out: COM objects can't cross
+       Streamlit's per-rerun script threads, so workers still attach their own OutlookSession,
+       which is fast once Outlook is up."""
+    def __init__(self):
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="outlook-keepalive", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+    def _run(self):
+        pythoncom.CoInitialize()
+        try:
+            # EnsureDispatch generates the gen_py typelib module here, once, before any generate
+            # workers start; several workers building a cold cache at the same time would race
+            try:
+                app = win32com.client.gencache.EnsureDispatch("Outlook.Application")
+            except Exception:
+                app = win32com.client.Dispatch("Outlook.Application")
+        except Exception as e:
+            self.error = e
+            app = None
+        self._ready.set()
+        while app is not None and not self._stop.wait(1.0):
+            pythoncom.PumpWaitingMessages()
+        app = None
+        pythoncom.CoUninitialize()
+    def is_alive(self) -> bool:
+        return self.error is None and self._thread.is_alive()
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+@st.cache_resource(show_spinner="Starting Outlook…", validate=lambda ka: ka.is_alive(),
+                   on_release=lambda ka: ka.close())
+def get_outlook_keepalive() -> OutlookKeepAlive:
+    """Process-wide keep-alive: Outlook's cold start is paid once, not on every click."""
+    ka = OutlookKeepAlive()
+    if ka.error is not None:
+        raise ka.error  # not cached; the next click retries
+    return ka
+
+def create_oft_bytes_reuse(outlook: OutlookSession, subject: str, to_: str, cc_: str, bcc_: str, html_body: str) -> bytes:
     """
-    Create .oft via Outlook COM reuse. Ensures:
+    Create .oft via Outlook COM reuse (the session's MailItem is re-filled each call). Ensures:
     - BodyFormat = 2 (olFormatHTML)
     - SaveAs(..., 2)  -> 2 = olTemplate
     """
-    mail = outlook.CreateItem(0)  # 0 = olMailItem
+    mail = outlook.mail
     mail.To = to_
     mail.CC = cc_
     mail.BCC = bcc_
     mail.Subject = subject or " "     # some Outlook versions require non-empty subject
     mail.BodyFormat = 2               # 2 = olFormatHTML
     mail.HTMLBody = html_body
-    with tempfile.TemporaryDirectory() as tmp:
-        path = os.path.join(tmp, "tmp.oft")
-        mail.SaveAs(path, 2)          # 2 = olTemplate (.oft)
-        with open(path, "rb") as f:
-            return f.read()
+    path = os.path.join(outlook.tmpdir, "tmp.oft")  # SaveAs overwrites it on every call
+    mail.SaveAs(path, 2)          # 2 = olTemplate (.oft)
+    with open(path, "rb") as f:
+        return f.read()
 
 # -------------------------------------
 # Subjects & Bodies
@@ -229,6 +387,7 @@ If in case you’re tied up with case work, please feel free to let us know if w
 """
 
 # Placeholders for non-ER&D (same structure, lorem ipsum)
+@functools.lru_cache(maxsize=8)
 def _lipsum_initial(func_label: str) -> str:
     return f"""
 <p>Hi {{ {{ case_manager_name }} }},</p>
@@ -248,6 +407,7 @@ The benchmarking team (in cc) will follow up with specifics and support througho
 <p>Best,<br/>Sebastian</p>
 """.strip()
 
+@functools.lru_cache(maxsize=8)
 def _lipsum_poc(func_label: str) -> str:
     return f"""
 <p>Hi {{ {{ case_manager_name }} }},</p>
@@ -277,6 +437,7 @@ Following up on the note below, we would appreciate your support in completing t
 <p>We aim to collect both ‘As-Is’ and ‘To-Be’ data. Lorem ipsum dolor sit amet.</p>
 """.strip()
 
+@functools.lru_cache(maxsize=8)
 def _lipsum_escalation(func_label: str) -> str:
     return f"""
 <p>Hi {{ {{ case_manager_name }} }},</p>
@@ -297,9 +458,12 @@ If you're tied up with case work, happy to reconnect at a later date. Looking fo
 # Function set
 FUNCTIONS = ["ER&D", "Supply Chain", "Procurement", "Manufacturing"]
 
+@functools.lru_cache(maxsize=8)
 def get_templates_for_function(func_name: str) -> Dict[str, str]:
     """Return subject + bodies for the selected function.
-       For ER&D: exact wording; others: structure-matched lorem ipsum placeholders."""
+       For ER&D: exact wording; others: structure-matched lorem ipsum placeholders.
+       Cached per function label (Streamlit reruns call this on every interaction);
+       treat the returned dict as read-only."""
     if func_name == "ER&D":
         return {
             "subject": SUBJECT_ERD,
@@ -318,15 +482,154 @@ def get_templates_for_function(func_name: str) -> Dict[str, str]:
         "subject_label": func_name,
     }
 
+# -------------------------------------
+# Per-row preparation (shared by preview + generation)
+# -------------------------------------
+BCC_ALL = "//"
+
+# (zip folder, template key, preview heading, validation label) — one entry per OFT
+OFT_TEMPLATES = [
+    ("1_Sebastian_Initial", "sebastian", "Sebastian – Initial", "CC (Sebastian)"),
+    ("2_POC_Follow_Up", "poc", "POC – Follow-up", "CC (POC)"),
+    ("3_Aseem_Escalation", "aseem", "Aseem – Escalation", "CC (Aseem)"),
+]
+
+# Fixed benchmarking-team CCs
+ERDDB_TEAM_CC = "ERDDBTeam.Global@Bain.com"
+SEBASTIAN_CC = "Sebastian.Sambale@Bain.com"
+STATIC_CC = frozenset({ERDDB_TEAM_CC, SEBASTIAN_CC})
+
+# CC recipe per template, merged in this order: Excel column names, or STATIC_CC addresses
+# (rules same as ER&D for now)
+CC_RULES = {
+    "sebastian": ("team_lead_email", "POC_name", "extra_cc", ERDDB_TEAM_CC),
+    "poc": (ERDDB_TEAM_CC, "team_lead_email", SEBASTIAN_CC),
+    "aseem": (SEBASTIAN_CC, "team_lead_email", ERDDB_TEAM_CC, "POC_name"),
+}
+
+@st.cache_data(show_spinner=False)
+def prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean every row at once with pandas string ops: stripped fields, POC display name,
+       the three CC lines (CC_RULES) and invalid-recipient reports."""
+    out = pd.DataFrame(index=df.index)
+    for col in ("client_name", "case_code", "case_manager_name", "to",
+                "team_lead_email", "POC_name", "POC_display_name", "extra_cc"):
+        out[col] = df[col].astype(str).str.strip()
+    no_disp = out["POC_display_name"].eq("")
+    out.loc[no_disp, "POC_display_name"] = out.loc[no_disp, "POC_name"].map(derive_display_name_from_email)
+
+    to_ = out["to"]
+    out["bad_to"] = invalid_recipients_column(to_)
+    for _, key, _, _ in OFT_TEMPLATES:
+        chunks = (c if c in STATIC_CC else out[c] for c in CC_RULES[key])
+        out[f"cc_{key}"] = build_cc_column(to_, *chunks)
+        out[f"bad_{key}"] = invalid_recipients_column(out[f"cc_{key}"])
+    return out
+
+def prepare_row(r: dict) -> dict:
+    """Render context + To/CC lines for one row of prepare_frame().
+       Built once per row; the three OFTs only differ in body + CC."""
+    client, code = r["client_name"], r["case_code"]
+    ctx = {
+        "client_name": client,
+        "case_code": code,
+        "case_manager_name": r["case_manager_name"],
+        "poc_display_name": r["POC_display_name"],
+    }
+    return {
+        "to": r["to"],
+        "ctx": ctx,
+        "cc": {key: r[f"cc_{key}"] for _, key, _, _ in OFT_TEMPLATES},
+        "base": sanitize_filename(f"{client} - {code}"),
+    }
+
+ZIP_SPOOL_MAX = 64 * 1024 * 1024  # bytes kept in memory before the output zip spills to a temp file
+OFT_WORKERS = 4  # Outlook serializes object-model calls internally; more threads stop paying off
+OFT_WINDOW = 2 * OFT_WORKERS  # rows generated ahead of the zip writer; bounds OFT bytes held in RAM
+WARN_PREVIEW_MAX = 200  # recipient warnings shown inline; the full list is offered as a download
+
+def _render_row(outlook: OutlookSession, job: dict, subject_tmpl: TemplateRenderer,
+                body_tmpls: Dict[str, TemplateRenderer]) -> tuple:
+    """Render + save the three OFTs of one prepared row. Returns ([(zip path, oft bytes)], None)
+       or (None, error)."""
+    try:
+        ectx = escape_context(job["ctx"])
+        subject = subject_tmpl(ectx)
+        files = []
+        for folder, key, _, _ in OFT_TEMPLATES:
+            body = body_tmpls[key](ectx)
+            oft_bytes = create_oft_bytes_reuse(outlook, subject, job["to"], job["cc"][key], BCC_ALL, body)
+            files.append((f"{folder}/{job['base']}.oft", oft_bytes))
+        return files, None
+    except Exception as e:
+        return None, e
+
+def _oft_worker(todo: queue.Queue, done: queue.Queue, subject_tmpl: TemplateRenderer,
+                body_tmpls: Dict[str, TemplateRenderer]) -> None:
+    """Worker thread: one Outlook session for its whole lifetime, fed (seq, job) items until None.
+       Posts (seq, job, files, error) per item; if Outlook can't be started in this thread it
+       posts (None, None, None, error) once and exits, leaving the rows to the other workers."""
+    try:
+        outlook = OutlookSession().__enter__()
+    except Exception as e:
+        done.put((None, None, None, e))
+        return
+    try:
+        while True:
+            item = todo.get()
+            if item is None:
+                return
+            seq, job = item
+            done.put((seq, job, *_render_row(outlook, job, subject_tmpl, body_tmpls)))
+    finally:
+        outlook.__exit__(None, None, None)
+
+def generate_ofts_in_order(jobs: List[dict], subject_tmpl: TemplateRenderer,
+                           body_tmpls: Dict[str, TemplateRenderer]):
+    """Yield (job, files, error) per job, in job order, as soon as each row is ready.
+       At most OFT_WINDOW rows are handed out ahead of the one being yielded, so only that many
+       rows' OFT bytes are ever held in memory (in flight or in the reorder buffer)."""
+    todo: queue.Queue = queue.Queue()
+    done: queue.Queue = queue.Queue()
+    workers = [threading.Thread(target=_oft_worker, args=(todo, done, subject_tmpl, body_tmpls),
+                                name=f"oft-worker-{n}", daemon=True)
+               for n in range(min(OFT_WORKERS, len(jobs)))]
+    for w in workers:
+        w.start()
+    ready: Dict[int, tuple] = {}  # reorder buffer: seq -> (job, files, error)
+    submitted = yielded = 0
+    alive = len(workers)
+    try:
+        while yielded < len(jobs):
+            while submitted < len(jobs) and submitted - yielded < OFT_WINDOW:
+                todo.put((submitted, jobs[submitted]))
+                submitted += 1
+            seq, job, files, err = done.get()
+            if seq is not None:
+                ready[seq] = (job, files, err)
+            else:  # a worker couldn't start Outlook
+                alive -= 1
+                if not alive:  # nobody left to take the remaining rows
+                    for k in range(yielded, len(jobs)):
+                        ready.setdefault(k, (jobs[k], None, err))
+            while yielded in ready:
+                yield ready.pop(yielded)
+                yielded += 1
+    finally:
+        # Also runs if the consumer stops early: workers drain the rows already queued (at most
+        # OFT_WINDOW), close their Outlook sessions on their own threads and exit
+        for _ in workers:
+            todo.put(None)
+        for w in workers:
+            w.join()
+
 # -------------------------------------
 # Generic DC generator (templated per function)
 # -------------------------------------
 def run_oft_generator_for_function(func_name: str):
     tpls = get_templates_for_function(func_name)
-    SUBJECT_COMMON = tpls["subject"]
-    BODY_SEBASTIAN = tpls["sebastian"]
-    BODY_POC = tpls["poc"]
-    BODY_ASEEM = tpls["aseem"]
+    subject_tmpl = compile_template(tpls["subject"])
+    body_tmpls = {key: compile_template(tpls[key]) for _, key, _, _ in OFT_TEMPLATES}
     subject_label = tpls["subject_label"]
 
     st.caption(f"Outputs real .oft files only (no EML). Subjects are identical for all three; BCC is '//' for all. Function: **{subject_label}**")
@@ -351,10 +654,10 @@ def run_oft_generator_for_function(func_name: str):
     st.subheader("1) Upload Excel (.xlsx)")
     excel_file = st.file_uploader("Upload a .xlsx file (first sheet will be used)", type=["xlsx"], key=f"uploader_{func_name}")
 
-    rows: List[dict] = []
+    prepared: Optional[pd.DataFrame] = None
     if excel_file is not None:
         try:
-            df = pd.read_excel(excel_file, dtype=str, keep_default_na=False).fillna("")
+            df = _load_excel(excel_file.getvalue())
             required = ["client_name", "case_code", "case_manager_name", "to", "team_lead_email", "POC_name"]
             missing = [c for c in required if c not in df.columns]
             if missing:
@@ -365,158 +668,120 @@ def run_oft_generator_for_function(func_name: str):
             if "extra_cc" not in df.columns:
                 df["extra_cc"] = ""
             st.dataframe(df[required + ["POC_display_name", "extra_cc"]], use_container_width=True)
-            rows = df.to_dict(orient="records")
+            prepared = prepare_frame(df)
         except Exception as e:
             st.error(f"Could not read Excel: {e}")
 
     # Preview
-    if rows:
+    has_rows = prepared is not None and not prepared.empty
+    if has_rows:
         st.subheader("2) Preview (from first row)")
-        r0 = rows[0]
-        # Safe strings
-        client_name      = str(r0.get("client_name") or "").strip()
-        case_code        = str(r0.get("case_code") or "").strip()
-        case_manager     = str(r0.get("case_manager_name") or "").strip()
-        to_cm            = str(r0.get("to") or "").strip()
-        team_lead_email  = str(r0.get("team_lead_email") or "").strip()
-        poc_email        = str(r0.get("POC_name") or "").strip()
-        poc_display_name = (str(r0.get("POC_display_name") or "").strip()
-                            or derive_display_name_from_email(poc_email))
-        extra_cc         = str(r0.get("extra_cc") or "").strip()
-        bcc_preview      = "//"
-
-        ctx = {
-            "client_name": client_name,
-            "case_code": case_code,
-            "case_manager_name": case_manager,
-            "poc_display_name": poc_display_name,
-            "today": datetime.now().strftime("%d %b %Y"),
-        }
-        subject_preview = render_text(SUBJECT_COMMON, ctx)
-
-        # --- Sebastian ---
-        cc_seb = build_cc(team_lead_email, poc_email, extra_cc, "ERDDBTeam.Global@Bain.com")
-        cc_seb = dedup_against_to(to_cm, cc_seb)
-        st.markdown("#### Sebastian – Initial")
-        st.write(f"**To:** {to_cm}")
-        st.write(f"**CC:** {cc_seb}")
-        st.write(f"**BCC:** {bcc_preview}")
-        st.write(f"**Subject:** {subject_preview}")
-        st.markdown(render_text(BODY_SEBASTIAN, ctx), unsafe_allow_html=True)
-        st.divider()
-
-        # --- POC ---
-        cc_poc = build_cc("ERDDBTeam.Global@Bain.com", team_lead_email, "Sebastian.Sambale@Bain.com")
-        cc_poc = dedup_against_to(to_cm, cc_poc)
-        st.markdown("#### POC – Follow-up")
-        st.write(f"**To:** {to_cm}")
-        st.write(f"**CC:** {cc_poc}")
-        st.write(f"**BCC:** {bcc_preview}")
-        st.write(f"**Subject:** {subject_preview}")
-        st.markdown(render_text(BODY_POC, ctx), unsafe_allow_html=True)
-        st.divider()
-
-        # --- Aseem ---
-        cc_aseem = build_cc("Sebastian.Sambale@Bain.com", team_lead_email, "ERDDBTeam.Global@Bain.com", poc_email)
-        cc_aseem = dedup_against_to(to_cm, cc_aseem)
-        st.markdown("#### Aseem – Escalation")
-        st.write(f"**To:** {to_cm}")
-        st.write(f"**CC:** {cc_aseem}")
-        st.write(f"**BCC:** {bcc_preview}")
-        st.write(f"**Subject:** {subject_preview}")
-        st.markdown(render_text(BODY_ASEEM, ctx), unsafe_allow_html=True)
-
-        st.dataframe(pd.DataFrame([{
-            "Template": "Sebastian – Initial", "To": to_cm, "CC": cc_seb, "BCC": bcc_preview
-        },{
-            "Template": "POC – Follow-up", "To": to_cm, "CC": cc_poc, "BCC": bcc_preview
-        },{
-            "Template": "Aseem – Escalation", "To": to_cm, "CC": cc_aseem, "BCC": bcc_preview
-        }]), use_container_width=True)
+        p0 = prepare_row(prepared.iloc[0].to_dict())
+        ectx0 = escape_context(p0["ctx"])
+        subject_preview = subject_tmpl(ectx0)
+
+        recap = []
+        for n, (_, key, heading, _) in enumerate(OFT_TEMPLATES):
+            if n:
+                st.divider()
+            st.markdown(f"#### {heading}")
+            st.write(f"**To:** {p0['to']}")
+            st.write(f"**CC:** {p0['cc'][key]}")
+            st.write(f"**BCC:** {BCC_ALL}")
+            st.write(f"**Subject:** {subject_preview}")
+            st.markdown(body_tmpls[key](ectx0), unsafe_allow_html=True)
+            recap.append({"Template": heading, "To": p0["to"], "CC": p0["cc"][key], "BCC": BCC_ALL})
+
+        st.dataframe(pd.DataFrame(recap), use_container_width=True)
 
     # Generate
     st.subheader("3) Generate & Download (real OFT)")
     if st.button("Generate .oft templates", key=f"btn_gen_{func_name}"):
-        if not rows:
+        if not has_rows:
             st.warning("Please upload Excel first.")
         elif not WINDOWS or not HAS_WIN32:
             st.error("This app requires Windows + Outlook (pywin32). Please run on a Windows machine with Outlook installed.")
         else:
-            mem = io.BytesIO()
-            status = []
-            with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf, OutlookSession() as outlook:
-                for i, r in enumerate(rows):
-                    try:
-                        client = str(r.get("client_name") or "").strip()
-                        code = str(r.get("case_code") or "").strip()
-                        cm = str(r.get("case_manager_name") or "").strip()
-                        to_ = str(r.get("to") or "").strip()
-                        tl = str(r.get("team_lead_email") or "").strip()
-                        poc = str(r.get("POC_name") or "").strip()
-                        poc_disp = (str(r.get("POC_display_name") or "").strip()
-                                    or derive_display_name_from_email(poc))
-                        extra = str(r.get("extra_cc") or "").strip()
-
-                        if not (client and code and to_):
-                            status.append(f"Row {i+1}: SKIPPED – missing client/code/to")
-                            continue
-
-                        ctx = {
-                            "client_name": client,
-                            "case_code": code,
-                            "case_manager_name": cm,
-                            "poc_display_name": poc_disp,
-                            "today": datetime.now().strftime("%d %b %Y"),
-                        }
-                        subject = render_text(SUBJECT_COMMON, ctx)
-                        base = sanitize_filename(f"{client} - {code}")
-                        bcc_val = "//"
-
-                        # Build & dedup recipients (rules same as ER&D for now)
-                        cc1_build = build_cc(tl, poc, extra, "ERDDBTeam.Global@Bain.com")
-                        cc2_build = build_cc("ERDDBTeam.Global@Bain.com", tl, "Sebastian.Sambale@Bain.com")
-                        cc3_build = build_cc("Sebastian.Sambale@Bain.com", tl, "ERDDBTeam.Global@Bain.com", poc)
-
-                        cc1 = dedup_against_to(to_, cc1_build)
-                        cc2 = dedup_against_to(to_, cc2_build)
-                        cc3 = dedup_against_to(to_, cc3_build)
-
-                        ok = True
-                        ok &= assert_recipients_or_warn(i, "To", to_)
-                        ok &= assert_recipients_or_warn(i, "CC (Sebastian)", cc1)
-                        ok &= assert_recipients_or_warn(i, "CC (POC)", cc2)
-                        ok &= assert_recipients_or_warn(i, "CC (Aseem)", cc3)
-                        if not ok:
-                            status.append(f"Row {i+1}: SKIPPED – invalid recipients")
-                            continue
-
-                        # 1) Sebastian
-                        body = render_text(BODY_SEBASTIAN, ctx)
-                        oft_bytes = create_oft_bytes_reuse(outlook, subject, to_, cc1, bcc_val, body)
-                        zf.writestr(f"1_Sebastian_Initial/{base}.oft", oft_bytes)
-
-                        # 2) POC
-                        body = render_text(BODY_POC, ctx)
-                        oft_bytes = create_oft_bytes_reuse(outlook, subject, to_, cc2, bcc_val, body)
-                        zf.writestr(f"2_POC_Follow_Up/{base}.oft", oft_bytes)
-
-                        # 3) Aseem
-                        body = render_text(BODY_ASEEM, ctx)
-                        oft_bytes = create_oft_bytes_reuse(outlook, subject, to_, cc3, bcc_val, body)
-                        zf.writestr(f"3_Aseem_Escalation/{base}.oft", oft_bytes)
-
-                        status.append(f"Row {i+1}: OK – {base}")
-                    except Exception as e:
-                        status.append(f"Row {i+1}: FAILED – {e}")
+            try:
+                get_outlook_keepalive()
+            except Exception as e:
+                st.error(f"Could not start Outlook: {e}")
+                return
+
+            # Phase 1 (main thread): one column-wise pass over prepare_frame() decides which rows
+            # reach Outlook; Streamlit calls must stay on this thread
+            bad_cols = {"To": "bad_to", **{label: f"bad_{key}" for _, key, _, label in OFT_TEMPLATES}}
+            missing = prepared[["client_name", "case_code", "to"]].eq("").any(axis=1)
+            invalid = ~missing & prepared[list(bad_cols.values())].ne("").any(axis=1)
+            status: Dict[int, str] = {}
+            bad_msgs: List[str] = []
+            for i in prepared.index[missing]:
+                status[i] = f"Row {i+1}: SKIPPED – missing client/code/to"
+            for i, r in prepared.loc[invalid, list(bad_cols.values())].iterrows():
+                for label, col in bad_cols.items():
+                    ok, msg = check_recipients(i, label, r[col])
+                    if not ok:
+                        bad_msgs.append(msg)
+                status[i] = f"Row {i+1}: SKIPPED – invalid recipients"
+            # One warning for the whole batch rather than a message to the browser per bad row
+            if bad_msgs:
+                shown = bad_msgs[:WARN_PREVIEW_MAX]
+                more = len(bad_msgs) - len(shown)
+                st.warning("  \n".join(shown + ([f"… and {more} more"] if more else [])))
+                if more:
+                    st.download_button(
+                        "⬇️ Download full recipient warnings",
+                        data="\n".join(bad_msgs),
+                        file_name=f"recipient-warnings-{func_name.lower().replace(' ', '')}.txt",
+                        mime="text/plain",
+                        key=f"dl_warn_{func_name}",
+                        on_click="ignore",  # a rerun would drop the generated ZIP and status log
+                    )
+
+            jobs: List[dict] = []
+            good = prepared[~(missing | invalid)]
+            for i, r in zip(good.index, good.to_dict(orient="records")):
+                try:
+                    prep = prepare_row(r)
+                    prep["row"] = i
+                    jobs.append(prep)
+                except Exception as e:
+                    status[i] = f"Row {i+1}: FAILED – {e}"
+
+            # Phase 2: worker threads (one Outlook session each) generate rows while this thread
+            # writes each finished row straight into the zip, in row order; the zip writer is not
+            # thread-safe, so only this thread touches it
+            # Spools to disk past ZIP_SPOOL_MAX so large batches don't hold every OFT in RAM
+            mem = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX)
+            with zipfile.ZipFile(mem, "w", zipfile.ZIP_DEFLATED) as zf:
+                for job, files, err in generate_ofts_in_order(jobs, subject_tmpl, body_tmpls):
+                    i = job["row"]
+                    if err is not None:
+                        status[i] = f"Row {i+1}: FAILED – {err}"
+                        continue
+                    for name, data in files:
+                        zf.writestr(name, data)
+                    status[i] = f"Row {i+1}: OK – {job['base']}"
+            # download_button rejects memoryviews and spooled files and copies whatever it gets into
+            # its media store, so read the spool out once and free it (RAM or temp file) right away
+            with mem:
+                mem.seek(0)
+                zip_bytes = mem.read()
 
             st.download_button(
                 "⬇️ Download ZIP (three OFT folders)",
-                data=mem.getvalue(),
+                data=zip_bytes,
                 file_name=f"bain-{func_name.lower().replace(' ', '')}-ofts_{datetime.now():%Y%m%d_%H%M%S}.zip",
                 mime="application/zip",
+                on_click="ignore",
             )
-            st.success(f"Generated real .oft files with the exact bodies (placeholders for {func_name} unless ER&D), same subject pattern, and BCC='//'. Rows processed: {len(rows)}")
-            st.text("\n".join(status[:500]))
+            st.success(f"Generated real .oft files with the exact bodies (placeholders for {func_name} unless ER&D), same subject pattern, and BCC='//'. Rows processed: {len(prepared)}")
+            st.text("\n".join(status[i] for i in sorted(status)[:500]))
+
+    if WINDOWS and HAS_WIN32 and st.button("Reset Outlook session", key=f"btn_reset_{func_name}",
+                                          help="Release the cached Outlook connection, e.g. after restarting Outlook."):
+        get_outlook_keepalive.clear()  # on_release closes the keep-alive, if one was cached
+        st.info("Outlook session released; it will be re-opened on the next generate.")
 
 # -------------------------------------
 # App Shell: Function selection
@@ -1,9 +1,24 @@
 import io
+import re
 from datetime import datetime
+from typing import List, Optional, Tuple
+import numpy as np
 import pandas as pd
 import streamlit as st
+from openpyxl import load_workbook
 
 # Make sure you have:  pip install openpyxl xlsxwriter
+# Optional (much faster .xlsx parsing):  pip install python-calamine
+try:
+    import python_calamine  # noqa: F401  (only probed; pandas drives it via engine="calamine")
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+# Copy-on-Write: row selections and column picks stay cheap views until something writes.
+# Always on from pandas 3.0, where setting the option is deprecated.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 st.set_page_config(page_title="Active Case Data Collection Filter", layout="wide")
 
@@ -18,7 +33,7 @@ and this app will:
 - keep cases whose **Case Start Date falls within** the selected range,
 - keep cases where **Applicable Functions** includes any of:  
   *Engineering Research and Development, Procurement, Supply Chain, Manufacturing*,
-- give you a **downloadable Excel** with the final list.
+- give you the final list as a **downloadable Excel** (or CSV / Parquet).
 
 > 🔁 If your file is `.xls`, open it in Excel and **Save As ➜ Excel Workbook (.xlsx)**, then upload.
 """
@@ -38,52 +53,142 @@ TARGET_FUNCTIONS = [
     "Supply Chain",
     "Manufacturing",
 ]
+# Built once at import. Kept as a string (matched with case=False) rather than a compiled
+# re.IGNORECASE pattern so pandas can hand it to Arrow's regex kernel. RE2 turns a pure
+# literal alternation into one DFA pass per value, already the multi-keyword scan an
+# Aho-Corasick automaton would give, without leaving Arrow for a per-row Python call.
+TARGET_FUNCTIONS_PATTERN = "|".join(re.escape(func) for func in TARGET_FUNCTIONS)
+
+
+def read_excel_xlsx(file, **kwargs):
+    """Read an .xlsx file with python-calamine when installed, otherwise openpyxl in
+    read-only (streaming) mode so the whole cell DOM is never built."""
+    if HAS_CALAMINE:
+        return pd.read_excel(file, engine="calamine", **kwargs)
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        return pd.read_excel(wb, engine="openpyxl", **kwargs)
+    finally:
+        wb.close()
 
 
-def read_excel_xlsx(file):
-    """Read an .xlsx file using openpyxl only."""
-    return pd.read_excel(file, engine="openpyxl")
+def read_header_xlsx(file) -> list:
+    """Header row of the first sheet. openpyxl's read-only mode streams just that row,
+    whereas calamine would load the whole sheet even for nrows=0."""
+    wb = load_workbook(file, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        ws.reset_dimensions()  # a stale stored dimension would cut the header row short
+        return list(next(ws.iter_rows(max_row=1, values_only=True), ()))
+    finally:
+        wb.close()
+
+
+# Columns the shortlist rules need
+REQUIRED_COLUMNS = [
+    "Case Code",
+    "Case Start Date",
+    "Case End Date",
+    "Applicable Functions",
+    "System DNC Status",
+]
+DATE_COLUMNS = ["Case Start Date", "Case End Date"]
+# Filter text columns, read as Arrow-backed strings so strip/contains run in Arrow's
+# vectorized kernels instead of over boxed Python objects
+TEXT_FILTER_DTYPES = {"System DNC Status": "string[pyarrow]", "Applicable Functions": "string[pyarrow]"}
+PREVIEW_ROWS = 20
+LARGE_EXPORT_ROWS = 50_000  # above this the download defaults to Parquet instead of XLSX
+
+
+@st.cache_data(show_spinner=False)
+def load_and_prepare(
+    file_bytes: bytes,
+) -> Tuple[pd.DataFrame, List[str], Optional[np.ndarray], Optional[np.ndarray]]:
+    """Parse the upload once per distinct file (cached across reruns, so moving the date
+    picker only re-runs the masks): filter text columns typed at read time and the date
+    columns parsed in place (unparseable cells become NaT). Returns the frame, the
+    required columns missing from the header, and the row order that sorts Case Start
+    Date plus the sorted dates themselves, for filter_cases().
+    The header is checked first; when a required column is missing only the preview rows
+    are read (with no sort arrays), for the caller to report."""
+    header = read_header_xlsx(io.BytesIO(file_bytes))
+    missing_cols = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing_cols:
+        return read_excel_xlsx(io.BytesIO(file_bytes), nrows=PREVIEW_ROWS), missing_cols, None, None
+
+    df = read_excel_xlsx(io.BytesIO(file_bytes), dtype=TEXT_FILTER_DTYPES)
+    # Date cells already arrive as datetimes, so this is a no-op for clean columns; it
+    # only has to coerce stray text (read_excel's parse_dates would leave those as object)
+    for col in DATE_COLUMNS:
+        df[col] = pd.to_datetime(df[col], errors="coerce")
+    # A status column holds a handful of distinct values: as a categorical the DNC rule
+    # compares small integer codes, and the column shrinks to 1-2 bytes per row
+    df["System DNC Status"] = df["System DNC Status"].astype("category")
+
+    # Start dates sorted once per upload (NaT sorts last), so each date-range change is two
+    # binary searches instead of comparisons over every row
+    starts = df["Case Start Date"].to_numpy()
+    start_order = np.argsort(starts, kind="stable")
+    return df, [], start_order, starts[start_order]
+
+
+def filter_cases(
+    df: pd.DataFrame,
+    start_order: np.ndarray,
+    sorted_starts: np.ndarray,
+    range_start: pd.Timestamp,
+    range_end: pd.Timestamp,
+) -> pd.DataFrame:
+    """Apply every shortlist rule and select the matching rows once. Rules run cheapest
+    first, each only on the row positions that survived the previous ones, so the string
+    work scales with the surviving rows rather than the whole sheet.
+    Takes the frame and start-date sort arrays returned by load_and_prepare()."""
+    # Case Start Date within selected range (inclusive; NaT sorts past any range end)
+    bounds = np.array([range_start, range_end], dtype=sorted_starts.dtype)
+    lo = np.searchsorted(sorted_starts, bounds[0], side="left")
+    hi = np.searchsorted(sorted_starts, bounds[1], side="right")
+    idx = np.sort(start_order[lo:hi])  # back to file order
+
+    # Only active cases (no Case End Date)
+    idx = idx[df["Case End Date"].iloc[idx].isna().to_numpy()]
+
+    # System DNC Status = "Allow Data Collection"
+    # (only the distinct categories are stripped; cell values stay as uploaded)
+    dnc = df["System DNC Status"].iloc[idx]
+    allowed = np.flatnonzero(dnc.cat.categories.str.strip() == "Allow Data Collection")
+    idx = idx[np.isin(dnc.cat.codes.to_numpy(), allowed)]
+
+    # Applicable Functions contains any of the target functions: one alternation, one scan
+    funcs = df["Applicable Functions"].iloc[idx]
+    idx = idx[funcs.str.contains(TARGET_FUNCTIONS_PATTERN, case=False, na=False).to_numpy(dtype=bool)]
+
+    return df.iloc[idx]
 
 
 if uploaded_file is not None:
-    # --- 2. Read Excel ---
+    # --- 2. Read Excel (parsed once per upload) ---
     try:
-        df = read_excel_xlsx(uploaded_file)
+        df, missing_cols, start_order, sorted_starts = load_and_prepare(uploaded_file.getvalue())
     except Exception as e:
         st.error(f"❌ Error reading Excel file: {e}")
         st.stop()
 
     st.subheader("📁 Preview of Uploaded Data")
-    st.dataframe(df.head(20))
-
-    # --- 3. Ensure required columns exist ---
-    required_columns = [
-        "Case Code",
-        "Case Start Date",
-        "Case End Date",
-        "Applicable Functions",
-        "System DNC Status",
-    ]
-    missing_cols = [c for c in required_columns if c not in df.columns]
+    st.dataframe(df.head(PREVIEW_ROWS))
+
+    # --- 3. Ensure required columns exist (checked on the header by load_and_prepare) ---
     if missing_cols:
         st.error(
             f"❌ These required columns are missing from your file: {', '.join(missing_cols)}"
         )
         st.stop()
 
-    # --- 4. Parse date columns safely ---
-    def parse_date_series(series):
-        return pd.to_datetime(series, errors="coerce")
-
-    df["Case Start Date_dt"] = parse_date_series(df["Case Start Date"])
-    df["Case End Date_dt"] = parse_date_series(df["Case End Date"])
-
-    # --- 5. Sidebar filters ---
+    # --- 4. Sidebar filters ---
     st.sidebar.header("🔍 Filters")
 
     # Default Case Start Date range for calendar
-    start_min = df["Case Start Date_dt"].min()
-    start_max = df["Case Start Date_dt"].max()
+    start_min = df["Case Start Date"].min()
+    start_max = df["Case Start Date"].max()
 
     if pd.isna(start_min):
         start_min = datetime(2020, 1, 1)  # fallback if no dates
@@ -106,33 +211,10 @@ if uploaded_file is not None:
     range_start = pd.to_datetime(range_start_date)
     range_end = pd.to_datetime(range_end_date)
 
-    # --- 6. Only active cases (no Case End Date) ---
-    active_mask = df["Case End Date_dt"].isna()
-
-    # --- 7. Case Start Date within selected range ---
-    start_in_range_mask = (
-        df["Case Start Date_dt"].notna()
-        & (df["Case Start Date_dt"] >= range_start)
-        & (df["Case Start Date_dt"] <= range_end)
-    )
+    # --- 5. Active, in-range, DNC-allowed, target-function cases ---
+    filtered_df = filter_cases(df, start_order, sorted_starts, range_start, range_end)
 
-    # --- 8. System DNC Status = "Allow Data Collection" ---
-    dnc_mask = df["System DNC Status"].astype(str).str.strip().eq("Allow Data Collection")
-
-    # --- 9. Applicable Functions contains any of the target functions ---
-    df["Applicable Functions_str"] = df["Applicable Functions"].astype(str)
-
-    func_mask = False
-    for func in TARGET_FUNCTIONS:
-        func_mask = func_mask | df["Applicable Functions_str"].str.contains(
-            func, case=False, na=False
-        )
-
-    # --- 10. Combine all masks ---
-    final_mask = active_mask & start_in_range_mask & dnc_mask & func_mask
-    filtered_df = df.loc[final_mask].copy()
-
-    # --- 11. Show results ---
+    # --- 6. Show results ---
     st.subheader("✅ Shortlisted Active Cases (Ready for Data Collection)")
     st.write(
         f"**Total cases matching filters:** {len(filtered_df)} "
@@ -142,21 +224,50 @@ if uploaded_file is not None:
     if not filtered_df.empty:
         st.dataframe(filtered_df)
 
-        # --- 12. Download filtered Excel ---
+        # --- 7. Download filtered cases ---
         def to_excel_bytes(dataframe: pd.DataFrame) -> bytes:
             buffer = io.BytesIO()
-            with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            # Write every string as-is: skips xlsxwriter's per-cell URL/formula/number probes
+            # (and keeps a stray "=..." cell from becoming a live formula). constant_memory is
+            # not an option here: pandas writes column by column, and that mode only keeps
+            # the current row, silently dropping the rest.
+            options = {"strings_to_urls": False, "strings_to_formulas": False, "strings_to_numbers": False}
+            with pd.ExcelWriter(buffer, engine="xlsxwriter", engine_kwargs={"options": options}) as writer:
                 dataframe.to_excel(writer, index=False, sheet_name="Active Cases")
-            buffer.seek(0)
-            return buffer.read()
+            return buffer.getvalue()
+
+        def to_csv_bytes(dataframe: pd.DataFrame) -> bytes:
+            # BOM so Excel opens non-ASCII client names correctly
+            return dataframe.to_csv(index=False).encode("utf-8-sig")
 
-        excel_bytes = to_excel_bytes(filtered_df)
+        def to_parquet_bytes(dataframe: pd.DataFrame) -> bytes:
+            # Excel columns often mix numbers and text, which Arrow refuses in one column
+            mixed = [col for col, dtype in dataframe.dtypes.items() if pd.api.types.is_object_dtype(dtype)]
+            buffer = io.BytesIO()
+            dataframe.astype(dict.fromkeys(mixed, "string")).to_parquet(
+                buffer, engine="pyarrow", compression="zstd", index=False
+            )
+            return buffer.getvalue()
+
+        # XLSX is the slowest format to write; large shortlists default to Parquet
+        export_formats = {
+            "xlsx": ("Excel", to_excel_bytes, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+            "csv": ("CSV", to_csv_bytes, "text/csv"),
+            "parquet": ("Parquet", to_parquet_bytes, "application/vnd.apache.parquet"),
+        }
+        export_format = st.radio(
+            "Download format",
+            list(export_formats),
+            index=2 if len(filtered_df) > LARGE_EXPORT_ROWS else 0,
+            horizontal=True,
+        )
+        format_label, to_bytes, mime = export_formats[export_format]
 
         st.download_button(
-            label="📥 Download filtered cases as Excel",
-            data=excel_bytes,
-            file_name=f"active_cases_{range_start_date}_to_{range_end_date}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            label=f"📥 Download filtered cases as {format_label}",
+            data=to_bytes(filtered_df),
+            file_name=f"active_cases_{range_start_date}_to_{range_end_date}.{export_format}",
+            mime=mime,
         )
     else:
         st.info(